@@ -15,3 +15,30 @@ GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY")
 SUPABASE_URL = os.environ.get("SUPABASE_URL")
 SUPABASE_SERVICE_KEY = os.environ.get("SUPABASE_SERVICE_KEY")
 CRON_SECRET = os.environ.get("CRON_SECRET")
+
+
+# --- Logging ---
+# Per-schedule details are logged at DEBUG; each run logs one INFO summary.
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+
+
+# --- Scheduler Tuning ---
+# Number of due schedules processed concurrently per cron run (the work is I/O-bound).
+SCHEDULER_MAX_WORKERS = int(os.environ.get("SCHEDULER_MAX_WORKERS", 16))
+
+# Maximum number of due schedules claimed per batch; a run keeps claiming
+# batches until nothing is due.
+SCHEDULER_BATCH_SIZE = int(os.environ.get("SCHEDULER_BATCH_SIZE", 500))
+
+# Time after which a run stops claiming new batches; the remaining backlog is
+# left for the next cron tick.
+SCHEDULER_MAX_RUN_SECONDS = float(os.environ.get("SCHEDULER_MAX_RUN_SECONDS", 240))
+
+# Outbound messages per second allowed by each process. The rate limiter is per
+# process, so set this to the provider cap (WhatsApp Business default is 80)
+# divided by the number of processes that can send at once: Gunicorn workers
+# (WEB_CONCURRENCY) times instances.
+FONNTE_MPS = float(os.environ.get("FONNTE_MPS", 80))
+
+# Maximum number of Fonnte requests in flight at once when flushing a batch.
+FONNTE_MAX_CONCURRENCY = int(os.environ.get("FONNTE_MAX_CONCURRENCY", 32))
@@ -1,8 +1,16 @@
 # database_scheduler.py
+# Scheduler Database Operations
+#
+# The due-schedule claim relies on the `claim_due_schedules` function and the
+# partial index on scheduled_actions(next_run_at) WHERE status = 'active'
+# (see supabase/migrations/).
 import logging
+from collections import defaultdict
+from functools import lru_cache
 from supabase import Client
 from typing import Dict, List, Any, Union
-from datetime import datetime, time, timezone
+from datetime import datetime, time, timezone, tzinfo
+from zoneinfo import ZoneInfo
 
 logger = logging.getLogger(__name__)
 
@@ -21,14 +29,44 @@ def get_due_schedules(supabase: Client, now_utc_iso: str) -> List[Dict[str, Any]
         logger.error(f"DB Error fetching due schedules: {e}")
         return []
 
+def claim_due_schedules(supabase: Client, now_utc_iso: str, limit: int = 500) -> List[Dict[str, Any]]:
+    """
+    Atomically claims up to `limit` due schedules (marking them 'running') and
+    returns them with the owner's phone number, in one round trip.
+    Backed by the `claim_due_schedules` Postgres function; rows locked by a
+    concurrent claim are skipped rather than waited on, and rows stuck in
+    'running' for over 15 minutes (their run died) are claimed again.
+    """
+    try:
+        res = supabase.rpc("claim_due_schedules", {"now_ts": now_utc_iso, "lim": limit}).execute()
+        return res.data if res.data else []
+    except Exception as e:
+        logger.error(f"DB Error claiming due schedules: {e}")
+        return []
+
 def update_schedule(supabase: Client, schedule_id: str, patch: Dict) -> None:
     """Updates a schedule record with new data (e.g., new status or next_run_at)."""
     try:
         supabase.table("scheduled_actions").update(patch).eq("id", schedule_id).execute()
-        logger.info(f"Successfully updated schedule {schedule_id}")
+        logger.debug(f"Successfully updated schedule {schedule_id}")
     except Exception as e:
         logger.error(f"DB Error updating schedule {schedule_id}: {e}")
 
+def update_schedules_bulk(supabase: Client, patches: Dict[str, Dict]) -> None:
+    """
+    Applies a patch per schedule id in a single round trip, through the
+    `apply_schedule_patches` Postgres function. Patches may set status,
+    next_run_at, last_run_at and error_message; other keys are ignored.
+    """
+    if not patches:
+        return
+    rows = [{"id": schedule_id, **patch} for schedule_id, patch in patches.items()]
+    try:
+        supabase.rpc("apply_schedule_patches", {"patches": rows}).execute()
+        logger.debug(f"Successfully updated {len(rows)} schedule(s)")
+    except Exception as e:
+        logger.error(f"DB Error bulk updating schedules {list(patches)}: {e}")
+
 # --- User and Task Related Functions ---
 
 def get_user_phone_by_id(supabase: Client, user_id: str) -> Union[str, None]:
@@ -60,16 +98,19 @@ def create_task_from_schedule(supabase: Client, user_id: str, payload: Dict) ->
 
 # --- NEW: Daily Summary Functions ---
 
+@lru_cache(maxsize=512)
+def _user_tz(timezone_name: str) -> tzinfo:
+    """Resolves an IANA timezone name, defaulting to UTC if it is missing or invalid."""
+    try:
+        return ZoneInfo(timezone_name)
+    except Exception:
+        return timezone.utc
+
 def get_daily_summary_data(supabase: Client, user_id: str, user_timezone_str: str = 'UTC') -> Dict[str, Any]:
     """
     Fetches all non-completed tasks and active schedules for the day for a user.
     """
-    try:
-        # Get the correct timezone object, default to UTC if invalid
-        user_tz = timezone(user_timezone_str)
-    except Exception:
-        user_tz = timezone.utc
-
+    user_tz = _user_tz(user_timezone_str or 'UTC')
     today = datetime.now(user_tz).date()
     start_of_day_utc = datetime.combine(today, time.min, tzinfo=user_tz).astimezone(timezone.utc)
     end_of_day_utc = datetime.combine(today, time.max, tzinfo=user_tz).astimezone(timezone.utc)
@@ -85,7 +126,7 @@ def get_daily_summary_data(supabase: Client, user_id: str, user_timezone_str: st
 
         # 2. Fetch all active schedules that will run today
         schedules_res = supabase.table("scheduled_actions") \
-            .select("action_payload, schedule_value") \
+            .select("action_payload") \
             .eq("user_id", user_id) \
             .eq("status", "active") \
             .gte("next_run_at", start_of_day_utc.isoformat()) \
@@ -99,19 +140,23 @@ def get_daily_summary_data(supabase: Client, user_id: str, user_timezone_str: st
         logger.error(f"DB Error fetching daily summary for user {user_id}: {e}")
         return {"tasks": [], "schedules": []}
 
+_SUMMARY_HEADER = "*Your Daily Summary* 🗓️\n"
+_SUMMARY_TASKS_HEADER = "*Pending Tasks:*"
+_SUMMARY_NO_TASKS = "✅ You have no pending tasks!"
+_SUMMARY_SCHEDULES_HEADER = "\n\n*Scheduled For Today:*"
+
 def format_daily_summary_message(summary_data: Dict[str, Any]) -> str:
     """Formats the tasks and schedules into a readable string message."""
-    message_parts = ["*Your Daily Summary* 🗓️\n"]
+    message_parts = [_SUMMARY_HEADER]
 
     # --- Format Tasks ---
     tasks = summary_data.get("tasks", [])
     if tasks:
-        message_parts.append("*Pending Tasks:*")
-        tasks_by_date = {}
+        message_parts.append(_SUMMARY_TASKS_HEADER)
+        tasks_by_date = defaultdict(list)
         for task in tasks:
-            due_date = task.get('due_date', 'No Due Date')
-            if due_date not in tasks_by_date: tasks_by_date[due_date] = []
-            tasks_by_date[due_date].append(task)
+            # Supabase returns null due dates as None, so fall back explicitly.
+            tasks_by_date[task.get('due_date') or 'No Due Date'].append(task)
 
         for due_date in sorted(tasks_by_date.keys()):
             message_parts.append(f"\n*Due: {due_date}*")
@@ -119,12 +164,12 @@ def format_daily_summary_message(summary_data: Dict[str, Any]) -> str:
                 category = f" [{task['category']}]" if task.get('category') else ""
                 message_parts.append(f"- {task['title']}{category}")
     else:
-        message_parts.append("✅ You have no pending tasks!")
+        message_parts.append(_SUMMARY_NO_TASKS)
 
     # --- Format Schedules for Today ---
     schedules = summary_data.get("schedules", [])
     if schedules:
-        message_parts.append("\n\n*Scheduled For Today:*")
+        message_parts.append(_SUMMARY_SCHEDULES_HEADER)
         for schedule in schedules:
             payload = schedule.get('action_payload', {})
             item_name = payload.get('message', payload.get('title', 'a scheduled action'))
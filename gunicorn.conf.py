@@ -0,0 +1,23 @@
+# gunicorn.conf.py
+# Production server settings for running the scheduler outside Vercel:
+#
+#     gunicorn -c gunicorn.conf.py scheduler_service:app
+#
+# `app.run` in scheduler_service.py is only for local development.
+
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 8080)}"
+
+# gthread rather than gevent: a run already fans out on its own thread pool and
+# asyncio loop, which gevent's monkey-patching would interfere with.
+worker_class = "gthread"
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get("GUNICORN_THREADS", 4))
+
+# Under gthread this only restarts a worker whose main loop stops heartbeating;
+# it does not limit how long a request runs. A run's length is bounded by
+# SCHEDULER_MAX_RUN_SECONDS in config.py instead.
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 300))
+keepalive = 75
@@ -1,111 +1,154 @@
 # scheduler_service.py
 
 import os
+import atexit
+import hmac
+import logging
+import threading
+import time
 from flask import Flask, request, jsonify
-from supabase import create_client, Client
+import httpx
+import orjson
+from supabase import create_client, Client, ClientOptions
 from datetime import datetime, timezone
-import traceback
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from croniter import croniter
 import google.generativeai as genai
-from typing import Dict
+from typing import Dict, List, Optional, Tuple
 # Local imports
 import config
 import services
 import database_scheduler as db
 
+logging.basicConfig(level=config.LOG_LEVEL, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+# httpx logs every request at INFO; one line per Supabase call and send is too much.
+logging.getLogger("httpx").setLevel(logging.WARNING)
+logger = logging.getLogger(__name__)
+
 app = Flask(__name__)
 
 # --- Initialization ---
 if not all([config.SUPABASE_URL, config.SUPABASE_SERVICE_KEY, config.FONNTE_TOKEN, config.CRON_SECRET, config.GEMINI_API_KEY]):
     raise ValueError("One or more required environment variables are missing.")
 
-supabase: Client = create_client(config.SUPABASE_URL, config.SUPABASE_SERVICE_KEY)
+# Built once; compared in constant time on every request.
+_EXPECTED_AUTH = f"Bearer {config.CRON_SECRET}".encode()
+
+class OrjsonHttpClient(httpx.Client):
+    """
+    httpx client that encodes `json=` request bodies (all postgrest writes and
+    RPC calls) with orjson instead of the stdlib, which is several times faster
+    on the large bodies of batched writes. Responses are left alone: postgrest
+    already parses results with pydantic-core.
+    """
+    def build_request(self, method: str, url, *, content=None, json=None, headers=None, **kwargs) -> httpx.Request:
+        if json is not None:
+            content = orjson.dumps(json)
+            headers = httpx.Headers(headers)
+            headers["Content-Type"] = "application/json"
+        return super().build_request(method, url, content=content, headers=headers, **kwargs)
+
+# One client per process over a keep-alive connection pool, so TCP/TLS setup
+# is paid once rather than on every query.
+_supabase_http = OrjsonHttpClient(
+    limits=httpx.Limits(max_keepalive_connections=20, max_connections=40),
+    timeout=httpx.Timeout(10.0),
+)
+atexit.register(_supabase_http.close)
+supabase: Client = create_client(
+    config.SUPABASE_URL,
+    config.SUPABASE_SERVICE_KEY,
+    options=ClientOptions(httpx_client=_supabase_http),
+)
 genai.configure(api_key=config.GEMINI_API_KEY)
 # Note: Ensure you are using a model that fits your use case.
 ai_model = genai.GenerativeModel('gemini-2.5-flash')
 
+# --- Message Templates ---
+# Fixed texts are built once here rather than on every schedule.
+_DEFAULT_REMINDER = "You have a scheduled reminder."
+_CREATE_TASK_FAILED = "⚠️ I tried to create a scheduled task for you, but something went wrong."
+_AI_PROMPT_FAILED = "⚠️ I tried to run your scheduled AI action, but an error occurred."
+_AI_RESPONSE_HEADER = "🤖 Here is your scheduled AI response:\n\n"
+
 # --- The Action Executor Class ---
 class ActionExecutor:
     """
     This class is responsible for executing the specific action defined
     in a schedule record from the database.
+    Actions don't send WhatsApp messages themselves; they return the message
+    so the caller can deliver a whole run's messages in one batch.
     """
     def __init__(self, supabase_client: Client, ai_model_instance):
         self.supabase = supabase_client
         self.ai_model = ai_model_instance
+        # Routes each action type to its method; add new action types here.
+        self._handlers = {
+            'send_notification': self._execute_send_notification,
+            'create_task': self._execute_create_task,
+            'execute_prompt': self._execute_ai_prompt,
+            'daily_summary': self._execute_daily_summary,
+        }
 
-    def execute(self, schedule: Dict):
-        action_type = schedule.get('action_type')
-        
-        # A simple router to call the correct method based on the action type.
-        if action_type == 'send_notification':
-            self._execute_send_notification(schedule)
-        elif action_type == 'create_task':
-            self._execute_create_task(schedule)
-        elif action_type == 'execute_prompt':
-            self._execute_ai_prompt(schedule)
-        # --- NEW: Add the daily_summary action to the router ---
-        elif action_type == 'daily_summary':
-            self._execute_daily_summary(schedule)
-        else:
-            print(f"Unknown action type: {action_type}")
+    def execute(self, schedule: Dict, user_phone: Optional[str]) -> Optional[Tuple[str, str]]:
+        """
+        Runs the schedule's action for the owner's phone (resolved by the caller).
+        Returns the (phone, message) to deliver, if any.
+        """
+        handler = self._handlers.get(schedule.get('action_type'), self._execute_unknown)
+        message = handler(schedule, user_phone)
+        return (user_phone, message) if user_phone and message else None
+
+    def _execute_unknown(self, schedule: Dict, user_phone: Optional[str]) -> None:
+        logger.warning(f"Unknown action type: {schedule.get('action_type')}")
+        return None
 
-    def _execute_send_notification(self, schedule: Dict):
-        user_phone = db.get_user_phone_by_id(self.supabase, schedule['user_id'])
+    def _execute_send_notification(self, schedule: Dict, user_phone: Optional[str]) -> Optional[str]:
         if not user_phone: 
-            print(f"Skipping notification for user {schedule['user_id']}: No phone number found.")
-            return
+            logger.debug(f"Skipping notification for user {schedule['user_id']}: No phone number found.")
+            return None
 
-        message = schedule.get('action_payload', {}).get('message', 'You have a scheduled reminder.')
-        success = services.send_fonnte_message(user_phone, f"🔔 Reminder: {message}")
-        if success:
-            print(f"Message successfully queued for sending to user {schedule['user_id']}.")
-        else:
-            print(f"Failed to send notification for schedule {schedule['id']}.")
+        message = schedule.get('action_payload', {}).get('message', _DEFAULT_REMINDER)
+        return f"🔔 Reminder: {message}"
 
-    def _execute_create_task(self, schedule: Dict):
-        user_phone = db.get_user_phone_by_id(self.supabase, schedule['user_id'])
+    def _execute_create_task(self, schedule: Dict, user_phone: Optional[str]) -> Optional[str]:
         payload = schedule.get('action_payload', {})
         new_task = db.create_task_from_schedule(self.supabase, schedule['user_id'], payload)
         
         if new_task:
             title = new_task.get('title')
-            print(f"Created scheduled task '{title}' for user {schedule['user_id']}")
-            if user_phone:
-                services.send_fonnte_message(user_phone, f"✅ I've just created your scheduled task: '{title}'")
+            logger.debug(f"Created scheduled task '{title}' for user {schedule['user_id']}")
+            return f"✅ I've just created your scheduled task: '{title}'"
         else:
-            print(f"Failed to create scheduled task for user {schedule['user_id']}")
-            if user_phone:
-                services.send_fonnte_message(user_phone, "⚠️ I tried to create a scheduled task for you, but something went wrong.")
+            logger.warning(f"Failed to create scheduled task for user {schedule['user_id']}")
+            return _CREATE_TASK_FAILED
 
-    def _execute_ai_prompt(self, schedule: Dict):
-        user_phone = db.get_user_phone_by_id(self.supabase, schedule['user_id'])
-        if not user_phone: return
+    def _execute_ai_prompt(self, schedule: Dict, user_phone: Optional[str]) -> Optional[str]:
+        if not user_phone: return None
 
         prompt = schedule.get('action_payload', {}).get('prompt')
         if not prompt:
-            print(f"Execute prompt for user {schedule['user_id']} failed: No prompt in payload.")
-            return
+            logger.warning(f"Execute prompt for user {schedule['user_id']} failed: No prompt in payload.")
+            return None
         
         try:
-            print(f"Executing AI prompt for user {schedule['user_id']}...")
+            logger.debug(f"Executing AI prompt for user {schedule['user_id']}...")
             response = self.ai_model.generate_content(prompt)
-            services.send_fonnte_message(user_phone, f"🤖 Here is your scheduled AI response:\n\n{response.text}")
-            print(f"Sent AI prompt response to user {schedule['user_id']}")
+            return _AI_RESPONSE_HEADER + response.text
         except Exception as e:
-            print(f"AI prompt execution failed for user {schedule['user_id']}: {e}")
-            services.send_fonnte_message(user_phone, "⚠️ I tried to run your scheduled AI action, but an error occurred.")
+            logger.error(f"AI prompt execution failed for user {schedule['user_id']}: {e}")
+            return _AI_PROMPT_FAILED
 
     # --- NEW: Method to handle the daily summary ---
-    def _execute_daily_summary(self, schedule: Dict):
-        """Fetches, formats, and sends the user's daily summary."""
+    def _execute_daily_summary(self, schedule: Dict, user_phone: Optional[str]) -> Optional[str]:
+        """Fetches and formats the user's daily summary."""
         user_id = schedule['user_id']
-        user_phone = db.get_user_phone_by_id(self.supabase, user_id)
         if not user_phone:
-            print(f"Skipping daily summary for user {user_id}: No phone number found.")
-            return
+            logger.debug(f"Skipping daily summary for user {user_id}: No phone number found.")
+            return None
         
-        print(f"Generating daily summary for user {user_id}...")
+        logger.debug(f"Generating daily summary for user {user_id}...")
         # The agent should have saved the user's timezone when creating the schedule
         user_timezone = schedule.get('timezone', 'UTC') 
         
@@ -113,74 +156,142 @@ class ActionExecutor:
         summary_data = db.get_daily_summary_data(self.supabase, user_id, user_timezone)
         
         # 2. Format the data into a user-friendly message
-        summary_message = db.format_daily_summary_message(summary_data)
-        
-        # 3. Send the message
-        success = services.send_fonnte_message(user_phone, summary_message)
-        if success:
-            print(f"Daily summary successfully sent to user {user_id}.")
-        else:
-            print(f"Failed to send daily summary for user {user_id}.")
+        return db.format_daily_summary_message(summary_data)
+
 
+# Stateless apart from its clients, so one instance serves every run and thread.
+executor = ActionExecutor(supabase, ai_model)
 
 # --- The Main Cron Job Endpoint ---
 @app.route('/api/run-schedules', methods=['POST'])
 def run_schedules_endpoint():
     # 1. Secure the endpoint
-    auth_header = request.headers.get('Authorization')
-    if auth_header != f"Bearer {config.CRON_SECRET}":
+    auth_header = request.headers.get('Authorization') or ""
+    if not hmac.compare_digest(auth_header.encode(), _EXPECTED_AUTH):
         return jsonify({"status": "error", "message": "Unauthorized"}), 401
 
-    print(f"\n--- SCHEDULER TRIGGERED at {datetime.now(timezone.utc).isoformat()} ---")
+    # One timestamp for the whole run, so every batch sees the same "now".
+    now_utc = datetime.now(timezone.utc)
+    logger.info(f"--- SCHEDULER TRIGGERED at {now_utc.isoformat()} ---")
     
     try:
-        executed_count = handle_due_schedules()
+        executed_count = handle_due_schedules(now_utc)
         return jsonify({"status": "success", "schedules_executed": executed_count}), 200
     except Exception as e:
-        print(f"!!! AN UNEXPECTED ERROR OCCURRED IN SCHEDULER: {e}")
-        traceback.print_exc()
+        logger.exception(f"!!! AN UNEXPECTED ERROR OCCURRED IN SCHEDULER: {e}")
         return jsonify({"status": "internal_server_error", "message": str(e)}), 500
 
-def handle_due_schedules():
-    """Finds and executes all due scheduled actions."""
-    now_utc = datetime.now(timezone.utc)
-    
-    due_schedules = db.get_due_schedules(supabase, now_utc.isoformat())
+def handle_due_schedules(now_utc: datetime) -> int:
+    """
+    Claims and executes all scheduled actions due at now_utc, a bounded batch
+    at a time, until none are left. Returns the number of schedules processed.
+    """
+    now_utc_iso = now_utc.isoformat()
+    # Most ticks find nothing due; the empty claim is their only round trip.
+    due_schedules = db.claim_due_schedules(supabase, now_utc_iso, config.SCHEDULER_BATCH_SIZE)
     if not due_schedules:
-        print("No due schedules found.")
+        logger.info("No due schedules found.")
         return 0
 
-    print(f"Found {len(due_schedules)} due schedule(s).")
-    executor = ActionExecutor(supabase, ai_model)
-    
-    for schedule in due_schedules:
-        try:
-            print(f"Processing schedule {schedule['id']} of type '{schedule['action_type']}'...")
-            executor.execute(schedule)
-            reschedule_or_complete_job(schedule, now_utc)
-        except Exception as e:
-            print(f"!!! FAILED to process schedule {schedule['id']}: {e}")
-            db.update_schedule(supabase, schedule['id'], {"status": "failed", "error_message": str(e)})
+    processed_count = 0
+    deadline = time.monotonic() + config.SCHEDULER_MAX_RUN_SECONDS
+    # Batches keep each claim and the memory held per batch bounded, so a
+    # backlog (e.g. after an outage) is worked off gradually over a few runs.
+    # One pool serves every batch; its threads are only started when needed.
+    with ThreadPoolExecutor(max_workers=config.SCHEDULER_MAX_WORKERS) as pool:
+        while due_schedules:
+            logger.info(f"Claimed {len(due_schedules)} due schedule(s).")
+            process_batch(pool, due_schedules, now_utc, now_utc_iso)
+            processed_count += len(due_schedules)
+            if time.monotonic() >= deadline:
+                logger.info("Run time limit reached; any schedules still due are left for the next run.")
+                break
+            due_schedules = db.claim_due_schedules(supabase, now_utc_iso, config.SCHEDULER_BATCH_SIZE)
 
-    return len(due_schedules)
+    return processed_count
 
-def reschedule_or_complete_job(schedule: dict, now_utc: datetime):
-    """Calculates the next run time for a recurring job or completes a one-time job."""
+def process_batch(pool: ThreadPoolExecutor, due_schedules: List[Dict], now_utc: datetime, now_utc_iso: str) -> None:
+    """
+    Executes a batch of claimed schedules, then records and delivers the results.
+    now_utc_iso is now_utc preformatted once per run for the patches.
+    """
+    # Each schedule is dominated by network waits (Supabase, Fonnte, Gemini),
+    # so they are processed concurrently. Bookkeeping writes are collected and
+    # flushed together afterwards.
+    results = list(pool.map(lambda schedule: process_schedule(schedule, now_utc, now_utc_iso), due_schedules))
+
+    patches = {schedule['id']: patch for schedule, (patch, _) in zip(due_schedules, results)}
+    db.update_schedules_bulk(supabase, patches)
+
+    # Deliver every outgoing message of this batch in one concurrent burst.
+    deliveries = [(schedule, delivery) for schedule, (_, delivery) in zip(due_schedules, results) if delivery]
+    sent = services.send_fonnte_messages([delivery for _, delivery in deliveries])
+    for (schedule, _), success in zip(deliveries, sent):
+        if not success:
+            logger.warning(f"Failed to send message for schedule {schedule['id']}.")
+
+    failed_count = sum(1 for patch in patches.values() if patch.get('status') == 'failed')
+    sent_count = sum(sent)
+    logger.info(
+        f"Batch finished: {len(due_schedules)} schedule(s) processed, {failed_count} failed; "
+        f"{sent_count} message(s) sent, {len(sent) - sent_count} not delivered."
+    )
+
+def process_schedule(schedule: dict, now_utc: datetime, now_utc_iso: str) -> Tuple[Dict, Optional[Tuple[str, str]]]:
+    """
+    Executes one schedule. Returns the patch to apply to its record (including
+    on failure) and the (phone, message) to deliver, if any.
+    """
+    try:
+        logger.debug(f"Processing schedule {schedule['id']} of type '{schedule['action_type']}'...")
+        # The phone comes attached to the row from db.claim_due_schedules.
+        delivery = executor.execute(schedule, schedule.get('phone'))
+        return reschedule_or_complete_job(schedule, now_utc, now_utc_iso), delivery
+    except Exception as e:
+        logger.error(f"!!! FAILED to process schedule {schedule['id']}: {e}")
+        return {"status": "failed", "error_message": str(e)}, None
+
+@lru_cache(maxsize=2048)
+def _compiled_cron(cron_rule: str) -> croniter:
+    """
+    Parses a cron rule once per process. Parsing is over half the cost of a
+    next-run computation; the iterator is re-pointed at each start time instead.
+    """
+    return croniter(cron_rule)
+
+# Cached iterators are stateful and shared by the worker threads.
+_CRON_LOCK = threading.Lock()
+
+@lru_cache(maxsize=1024)
+def next_cron_run_iso(cron_rule: str, now_utc: datetime) -> str:
+    """
+    Returns the next run time of a cron rule after now_utc, as an ISO string.
+    Memoized so jobs sharing a rule in the same run (e.g. many "0 9 * * *"
+    summaries) compute and format it once.
+    """
+    iterator = _compiled_cron(cron_rule)
+    with _CRON_LOCK:
+        iterator.set_current(now_utc, force=True)
+        next_run_utc = iterator.get_next(datetime)
+    return next_run_utc.isoformat()
+
+def reschedule_or_complete_job(schedule: dict, now_utc: datetime, now_utc_iso: str) -> Dict:
+    """
+    Calculates the next run time for a recurring job or completes a one-time job.
+    Returns the patch to apply to the schedule record.
+    """
     if schedule['schedule_type'] == 'cron':
         try:
-            cron_rule = schedule['schedule_value']
-            iterator = croniter(cron_rule, now_utc)
-            next_run_utc = iterator.get_next(datetime)
+            next_run_at = next_cron_run_iso(schedule['schedule_value'], now_utc)
 
-            update_payload = {"next_run_at": next_run_utc.isoformat(), "last_run_at": now_utc.isoformat()}
-            db.update_schedule(supabase, schedule['id'], update_payload)
-            print(f"Rescheduled job {schedule['id']}. Next run at: {next_run_utc.isoformat()}")
+            logger.debug(f"Rescheduled job {schedule['id']}. Next run at: {next_run_at}")
+            return {"status": "active", "next_run_at": next_run_at, "last_run_at": now_utc_iso}
         except Exception as e:
-            print(f"!!! FAILED to reschedule job {schedule['id']}: {e}")
-            db.update_schedule(supabase, schedule['id'], {"status": "failed", "error_message": f"CRON reschedule failed: {e}"})
+            logger.error(f"!!! FAILED to reschedule job {schedule['id']}: {e}")
+            return {"status": "failed", "error_message": f"CRON reschedule failed: {e}"}
     else: # 'one_time'
-        db.update_schedule(supabase, schedule['id'], {"status": "completed", "last_run_at": now_utc.isoformat()})
-        print(f"Completed one-time job {schedule['id']}.")
+        logger.debug(f"Completed one-time job {schedule['id']}.")
+        return {"status": "completed", "last_run_at": now_utc_iso}
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=int(os.environ.get('PORT', 8080)))
\ No newline at end of file
@@ -1,18 +1,56 @@
 # services.py
 
+import asyncio
+import logging
+import threading
+import time
+from typing import Dict, List, Tuple
+import httpx
 import requests
 import config
 
-def send_fonnte_message(phone_number: str, message: str) -> bool: # Add return type hint
+logger = logging.getLogger(__name__)
+
+FONNTE_SEND_URL = "https://api.fonnte.com/send"
+
+class TokenBucket:
     """
-    Sends a message using the Fonnte API.
-    Returns True on success, False on failure.
+    Thread-safe token bucket allowing `rate` operations per second, with bursts
+    of up to `capacity`. Shared by the sync and async senders.
     """
-    if not config.FONNTE_TOKEN:
-        print("!!! SERVICE ERROR: FONNTE_TOKEN is not set. Cannot send message.")
-        return False # <-- Return False
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Takes a token and returns how many seconds the caller must wait before using it."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            # A negative balance is a queue of reservations still being refilled.
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def acquire(self) -> None:
+        delay = self.reserve()
+        if delay:
+            time.sleep(delay)
 
-    url = "https://api.fonnte.com/send"
+    async def acquire_async(self) -> None:
+        delay = self.reserve()
+        if delay:
+            await asyncio.sleep(delay)
+
+# Keeps this process's outbound sends under config.FONNTE_MPS; the budget is
+# not shared with other workers or instances.
+_FONNTE_RATE_LIMITER = TokenBucket(rate=config.FONNTE_MPS, capacity=config.FONNTE_MPS)
+
+def _fonnte_request(phone_number: str, message: str) -> Tuple[Dict[str, str], Dict[str, str]]:
+    """Builds the headers and form payload for a Fonnte send request."""
     headers = {
         'Authorization': config.FONNTE_TOKEN
     }
@@ -21,23 +59,82 @@ def send_fonnte_message(phone_number: str, message: str) -> bool: # Add return t
         'message': message,
         'countryCode': '62',
     }
+    return headers, payload
+
+def _fonnte_succeeded(phone_number: str, response_data: Dict) -> bool:
+    """Checks Fonnte's response body, which can report a failure on an HTTP 200."""
+    if 'status' in response_data and response_data['status'] is True:
+        logger.debug(f"Successfully sent message to {phone_number}. Response: {response_data}")
+        return True
+    logger.error(f"!!! SERVICE ERROR: Fonnte API indicated failure. Response: {response_data}")
+    return False
+
+def send_fonnte_message(phone_number: str, message: str) -> bool: # Add return type hint
+    """
+    Sends a message using the Fonnte API.
+    Returns True on success, False on failure.
+    """
+    if not config.FONNTE_TOKEN:
+        logger.error("!!! SERVICE ERROR: FONNTE_TOKEN is not set. Cannot send message.")
+        return False # <-- Return False
+
+    headers, payload = _fonnte_request(phone_number, message)
     
     try:
-        response = requests.post(url, headers=headers, data=payload)
+        _FONNTE_RATE_LIMITER.acquire()
+        response = requests.post(FONNTE_SEND_URL, headers=headers, data=payload)
         response.raise_for_status() 
-        
-        # Optional: Check Fonnte's specific response body for success
-        response_data = response.json()
-        if 'status' in response_data and response_data['status'] is True:
-             print(f"Successfully sent message to {phone_number}. Response: {response_data}")
-             return True # <-- Return True on success
-        else:
-             print(f"!!! SERVICE ERROR: Fonnte API indicated failure. Response: {response_data}")
-             return False # <-- Return False if Fonnte says it failed
+        return _fonnte_succeeded(phone_number, response.json())
 
     except requests.exceptions.RequestException as e:
-        print(f"!!! SERVICE ERROR: Failed to send message to {phone_number}. Error: {e}")
-        # If the response exists, print it for more context (e.g., for 401 Unauthorized)
+        logger.error(f"!!! SERVICE ERROR: Failed to send message to {phone_number}. Error: {e}")
+        # If the response exists, log it for more context (e.g., for 401 Unauthorized)
         if e.response is not None:
-            print(f"!!! SERVICE ERROR: Response Body: {e.response.text}")
-        return False # <-- Return False on exception
\ No newline at end of file
+            logger.error(f"!!! SERVICE ERROR: Response Body: {e.response.text}")
+        return False # <-- Return False on exception
+
+async def send_fonnte_message_async(client: httpx.AsyncClient, phone_number: str, message: str) -> bool:
+    """
+    Async counterpart of send_fonnte_message that posts through a shared client.
+    Returns True on success, False on failure.
+    """
+    headers, payload = _fonnte_request(phone_number, message)
+
+    try:
+        await _FONNTE_RATE_LIMITER.acquire_async()
+        response = await client.post(FONNTE_SEND_URL, headers=headers, data=payload)
+        response.raise_for_status()
+        return _fonnte_succeeded(phone_number, response.json())
+
+    except httpx.HTTPError as e:
+        logger.error(f"!!! SERVICE ERROR: Failed to send message to {phone_number}. Error: {e}")
+        if isinstance(e, httpx.HTTPStatusError):
+            logger.error(f"!!! SERVICE ERROR: Response Body: {e.response.text}")
+        return False
+
+def send_fonnte_messages(messages: List[Tuple[str, str]]) -> List[bool]:
+    """
+    Sends a batch of (phone_number, message) pairs concurrently over one
+    connection pool. Returns a success flag per message, in input order.
+    """
+    if not messages:
+        return []
+    if not config.FONNTE_TOKEN:
+        logger.error("!!! SERVICE ERROR: FONNTE_TOKEN is not set. Cannot send message.")
+        return [False] * len(messages)
+
+    async def _send_all() -> List[bool]:
+        semaphore = asyncio.Semaphore(config.FONNTE_MAX_CONCURRENCY)
+        limits = httpx.Limits(max_connections=config.FONNTE_MAX_CONCURRENCY)
+        async with httpx.AsyncClient(timeout=10.0, limits=limits) as client:
+            async def _send(phone_number: str, message: str) -> bool:
+                async with semaphore:
+                    return await send_fonnte_message_async(client, phone_number, message)
+            # One unexpected error (e.g. a non-JSON body) must not sink the rest of the batch.
+            return await asyncio.gather(*(_send(phone, message) for phone, message in messages), return_exceptions=True)
+
+    results = asyncio.run(_send_all())
+    for (phone_number, _), result in zip(messages, results):
+        if isinstance(result, Exception):
+            logger.error(f"!!! SERVICE ERROR: Failed to send message to {phone_number}. Error: {result}")
+    return [result is True for result in results]
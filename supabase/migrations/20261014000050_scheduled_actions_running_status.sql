@@ -0,0 +1,45 @@
+-- claim_due_schedules (20261014000100) marks claimed rows with a new status,
+-- 'running'. If scheduled_actions.status is an enum, or has a CHECK constraint
+-- listing its values, 'running' has to be allowed first: otherwise every claim
+-- fails, and db.claim_due_schedules turns that into "No due schedules found".
+--
+-- This is its own migration, ahead of the claim functions, because a value
+-- added to an enum cannot be used in the transaction that added it.
+--
+-- A replaced CHECK constraint lists the statuses the scheduler writes; if the
+-- table holds any other status, add it below or the migration will fail.
+do $$
+declare
+    status_type oid;
+    status_check record;
+    had_status_check boolean := false;
+begin
+    select a.atttypid into status_type
+    from pg_attribute a
+    where a.attrelid = 'scheduled_actions'::regclass
+      and a.attname = 'status'
+      and not a.attisdropped;
+
+    if (select t.typtype from pg_type t where t.oid = status_type) = 'e' then
+        execute format('alter type %s add value if not exists %L', status_type::regtype, 'running');
+    end if;
+
+    for status_check in
+        select c.conname
+        from pg_constraint c
+        where c.conrelid = 'scheduled_actions'::regclass
+          and c.contype = 'c'
+          and pg_get_constraintdef(c.oid) ~ '\mstatus\M'
+          and pg_get_constraintdef(c.oid) !~ '''running'''
+    loop
+        execute format('alter table scheduled_actions drop constraint %I', status_check.conname);
+        had_status_check := true;
+    end loop;
+
+    if had_status_check then
+        alter table scheduled_actions
+            add constraint scheduled_actions_status_check
+            check (status in ('active', 'running', 'completed', 'failed'));
+    end if;
+end;
+$$;
@@ -0,0 +1,36 @@
+-- Claims every due, active schedule in a single statement: the rows are
+-- flipped to 'running' and returned together with the owner's phone number.
+-- Because the claim is one UPDATE ... RETURNING, two overlapping cron runs can
+-- never both pick up the same schedule.
+--
+-- The scheduler moves each claimed row on to 'active' (with a new
+-- next_run_at), 'completed' or 'failed' once it has been processed.
+-- 'running' is a new status value; 20261014000050 allows it in the column's
+-- enum or CHECK constraint, if it has one.
+create or replace function claim_due_schedules(now_ts timestamptz)
+returns table (
+    id uuid,
+    user_id uuid,
+    action_type text,
+    action_payload jsonb,
+    schedule_type text,
+    schedule_value text,
+    timezone text,
+    phone text
+)
+language sql
+as $$
+    update scheduled_actions s
+    set status = 'running'
+    where s.status = 'active'
+      and s.next_run_at <= now_ts
+    returning
+        s.id,
+        s.user_id,
+        s.action_type,
+        s.action_payload,
+        s.schedule_type,
+        s.schedule_value,
+        s.timezone,
+        (select w.phone from user_whatsapp w where w.user_id = s.user_id limit 1);
+$$;
@@ -0,0 +1,14 @@
+-- Indexes backing the scheduler's per-run queries.
+--
+-- Plain CREATE INDEX is used because migrations run inside a transaction; on a
+-- large live table, run the same statements by hand with CONCURRENTLY instead.
+
+-- claim_due_schedules: status = 'active' and next_run_at <= now.
+-- Partial, so finished/failed schedules never bloat the index.
+create index if not exists idx_scheduled_actions_due
+    on scheduled_actions (next_run_at)
+    where status = 'active';
+
+-- Owner phone lookup joined onto every claimed schedule.
+create index if not exists idx_user_whatsapp_user_id
+    on user_whatsapp (user_id);
@@ -0,0 +1,41 @@
+-- Bounds each claim to `lim` rows and locks them with FOR UPDATE SKIP LOCKED,
+-- so concurrent claimers split the due rows between them instead of queueing
+-- behind one another. Oldest-due schedules are claimed first.
+drop function if exists claim_due_schedules(timestamptz);
+
+create or replace function claim_due_schedules(now_ts timestamptz, lim int default 500)
+returns table (
+    id uuid,
+    user_id uuid,
+    action_type text,
+    action_payload jsonb,
+    schedule_type text,
+    schedule_value text,
+    timezone text,
+    phone text
+)
+language sql
+as $$
+    with due as (
+        select d.id
+        from scheduled_actions d
+        where d.status = 'active'
+          and d.next_run_at <= now_ts
+        order by d.next_run_at
+        limit lim
+        for update skip locked
+    )
+    update scheduled_actions s
+    set status = 'running'
+    from due
+    where s.id = due.id
+    returning
+        s.id,
+        s.user_id,
+        s.action_type,
+        s.action_payload,
+        s.schedule_type,
+        s.schedule_value,
+        s.timezone,
+        (select w.phone from user_whatsapp w where w.user_id = s.user_id limit 1);
+$$;
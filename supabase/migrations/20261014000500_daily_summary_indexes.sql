@@ -0,0 +1,13 @@
+-- Indexes for the per-user queries behind each daily_summary action
+-- (database_scheduler.get_daily_summary_data). Partial, matching the filters,
+-- so done tasks and inactive schedules stay out of them.
+
+-- Outstanding tasks for a user: user_id = ? and status <> 'done'.
+create index if not exists idx_tasks_user_open
+    on tasks (user_id)
+    where status <> 'done';
+
+-- A user's active schedules running today: user_id = ? and next_run_at in range.
+create index if not exists idx_scheduled_actions_user_active
+    on scheduled_actions (user_id, next_run_at)
+    where status = 'active';
@@ -0,0 +1,65 @@
+-- Records when a schedule was claimed, and lets a later claim take back rows
+-- left in 'running' by a run that died mid-batch (crash, timeout, redeploy).
+-- Without this, such rows would never leave 'running' and never run again.
+--
+-- claimed_at is stamped with the database clock at claim time, not with the
+-- caller's now_ts: a run reuses the now_ts it captured at its start for every
+-- batch, so later batches of a long run would otherwise look stale already.
+-- stale_after must exceed the time one batch takes to process.
+alter table scheduled_actions add column if not exists claimed_at timestamptz;
+
+-- Rows already left in 'running' by the earlier claim functions have no
+-- claim time; start their stale window now so they are recovered, but only
+-- once a run that might still hold them has had time to finish.
+update scheduled_actions
+set claimed_at = now()
+where status = 'running'
+  and claimed_at is null;
+
+create index if not exists idx_scheduled_actions_running
+    on scheduled_actions (claimed_at)
+    where status = 'running';
+
+drop function if exists claim_due_schedules(timestamptz, int);
+
+create or replace function claim_due_schedules(
+    now_ts timestamptz,
+    lim int default 500,
+    stale_after interval default interval '15 minutes'
+)
+returns table (
+    id uuid,
+    user_id uuid,
+    action_type text,
+    action_payload jsonb,
+    schedule_type text,
+    schedule_value text,
+    timezone text,
+    phone text
+)
+language sql
+as $$
+    with due as (
+        select d.id
+        from scheduled_actions d
+        where (d.status = 'active' and d.next_run_at <= now_ts)
+           or (d.status = 'running' and d.claimed_at < now() - stale_after)
+        order by d.next_run_at
+        limit lim
+        for update skip locked
+    )
+    update scheduled_actions s
+    set status = 'running',
+        claimed_at = now()
+    from due
+    where s.id = due.id
+    returning
+        s.id,
+        s.user_id,
+        s.action_type,
+        s.action_payload,
+        s.schedule_type,
+        s.schedule_value,
+        s.timezone,
+        (select w.phone from user_whatsapp w where w.user_id = s.user_id limit 1);
+$$;
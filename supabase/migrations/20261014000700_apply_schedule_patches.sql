@@ -0,0 +1,29 @@
+-- Writes the outcome of a whole batch of processed schedules in one statement
+-- (database_scheduler.update_schedules_bulk). Each element of `patches` is an
+-- object with the schedule `id` and any of the columns below; a column an
+-- element leaves out keeps its current value.
+--
+-- status is read back as text so the assignment also works if the column is an
+-- enum (text converts to an enum implicitly on assignment).
+create or replace function apply_schedule_patches(patches jsonb)
+returns integer
+language sql
+as $$
+    with updated as (
+        update scheduled_actions s
+        set status = coalesce(p.status, s.status::text),
+            next_run_at = coalesce(p.next_run_at, s.next_run_at),
+            last_run_at = coalesce(p.last_run_at, s.last_run_at),
+            error_message = coalesce(p.error_message, s.error_message)
+        from jsonb_to_recordset(patches) as p(
+            id uuid,
+            status text,
+            next_run_at timestamptz,
+            last_run_at timestamptz,
+            error_message text
+        )
+        where s.id = p.id
+        returning 1
+    )
+    select count(*)::integer from updated;
+$$;